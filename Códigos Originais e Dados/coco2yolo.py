@@ -1,54 +1,83 @@
-import json
+import time
 import argparse
 import logging
+from collections import defaultdict
+from multiprocessing import Pool
 from pathlib import Path
 
+import ijson
+import numpy as np
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def convert_coco_to_yolo(size, box):
+def convert_coco_to_yolo(scales, boxes):
+    """
+    Convert COCO bounding boxes to YOLO format, all at once.
+    scales: (N, 2) array with the (1 / width, 1 / height) of each box's image
+    boxes: (N, 4) array of [x_top_left, y_top_left, width, height] COCO bboxes
+    Returns an (N, 4) array of [x_center, y_center, width, height] normalized boxes.
+    """
+    xy = (boxes[:, :2] + boxes[:, 2:] / 2.0) * scales
+    wh = boxes[:, 2:] * scales
+    return np.concatenate([xy, wh], axis=1)
+
+def process_split(split, dataset_path):
+    """
+    Convert the COCO annotations of a single split to YOLO format.
+    """
+    label_path = Path(dataset_path) / "labels" / split / 'coco.json'
+    if not label_path.exists():
+        logger.warning(f"File not found: {label_path}")
+        return
+
+    start = time.perf_counter()
+    # Mapping from image id to filename
+    with open(label_path, 'rb') as f:
+        image_info = {img['id']: img for img in ijson.items(f, 'images.item', use_float=True)}
+    # Inverse image sizes and label file stems, computed once per image rather than once per annotation
+    inv_sizes = {img_id: (1. / img['width'], 1. / img['height']) for img_id, img in image_info.items()}
+    stems = {img_id: Path(img['file_name']).stem for img_id, img in image_info.items()}
+    
+    # Stream the annotations, keeping only what the conversion needs
+    category_ids, img_ids, coco_bboxes = [], [], []
+    with open(label_path, 'rb') as f:
+        for ann in ijson.items(f, 'annotations.item', use_float=True):
+            category_ids.append(ann['category_id'] - 1)  # Assuming category IDs are 1-indexed in COCO
+            img_ids.append(ann['image_id'])
+            coco_bboxes.append(ann['bbox'])
+    num_annotations = len(img_ids)
+
+    scales = np.array([inv_sizes[img_id] for img_id in img_ids], dtype=np.float64).reshape(-1, 2)
+    yolo_bboxes = convert_coco_to_yolo(scales, np.array(coco_bboxes, dtype=np.float64).reshape(-1, 4))
+
+    # Group the lines by label file so each file is written only once
+    lines = defaultdict(list)
+    for category_id, img_id, yolo_bbox in zip(category_ids, img_ids, yolo_bboxes.tolist()):
+        lines[stems[img_id]].append(f"{category_id} {' '.join(map(str, yolo_bbox))}")
+
+    for stem, label_lines in lines.items():
+        txt_path = label_path.parent / (stem + '.txt')
+        txt_path.write_text("\n".join(label_lines) + "\n")
+        logger.debug(f"Wrote {len(label_lines)} annotations to {txt_path}")
+
+    logger.info(f"Processed {num_annotations} annotations for {split} in {time.perf_counter() - start:.2f} s")
+
+def set_log_level(level):
     """
-    Convert COCO bounding box format to YOLO format.
-    size: (width, height) of the image
-    box: [x_top_left, y_top_left, width, height] COCO bbox
+    Set the log level of this module's logger, used to configure Pool workers.
     """
-    dw = 1. / size[0]
-    dh = 1. / size[1]
-    x = (box[0] + box[2] / 2.0) * dw
-    y = (box[1] + box[3] / 2.0) * dh
-    w = box[2] * dw
-    h = box[3] * dh
-    return (x, y, w, h)
+    logger.setLevel(level)
 
 def process_annotations(dataset_path):
     """
     Process COCO annotations and convert them to YOLO format.
+    Splits are independent, so each one is converted in its own process.
     """
-    for split in ['train', 'val', 'test']:
-        label_path = Path(dataset_path) / "labels" / split / 'coco.json'
-        if not label_path.exists():
-            logger.warning(f"File not found: {label_path}")
-            continue
-
-        with open(label_path) as f:
-            data = json.load(f)
-        
-        # Mapping from image id to filename
-        image_info = {img['id']: img for img in data['images']}
-        
-        # Process each annotation
-        for ann in data['annotations']:
-            img_id = ann['image_id']
-            coco_bbox = ann['bbox']
-            category_id = ann['category_id'] - 1  # Assuming category IDs are 1-indexed in COCO
-            img_filename = Path(image_info[img_id]['file_name'])
-            img_size = (image_info[img_id]['width'], image_info[img_id]['height'])
-            yolo_bbox = convert_coco_to_yolo(img_size, coco_bbox)
-            
-            txt_path = label_path.parent / (img_filename.stem + '.txt')
-            with open(txt_path, 'a') as file:
-                file.write(f"{category_id} {' '.join(map(str, yolo_bbox))}\n")
-            logger.info(f"Processed annotation for image: {img_filename}")
+    splits = ['train', 'val', 'test']
+    # Workers started with spawn/forkserver re-import this module, so hand them the current log level
+    with Pool(len(splits), initializer=set_log_level, initargs=(logger.level,)) as pool:
+        pool.starmap(process_split, [(split, dataset_path) for split in splits])
 
 def create_yaml_file(dataset_path):
     """
@@ -59,9 +88,8 @@ def create_yaml_file(dataset_path):
         logger.error(f"File not found: {label_path}")
         return
 
-    with open(label_path) as f:
-        data = json.load(f)
-    class_names = {category['id'] - 1: category['name'] for category in data['categories']}
+    with open(label_path, 'rb') as f:
+        class_names = {category['id'] - 1: category['name'] for category in ijson.items(f, 'categories.item')}
 
     # Ensure the classes are sorted by their ids and formatted correctly
     sorted_class_names = sorted(class_names.items())
@@ -85,8 +113,11 @@ names:
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Process COCO annotations and create YOLO dataset.")
     parser.add_argument("dataset_path", help="Path to the root directory of the dataset.")
+    parser.add_argument("--verbose", action="store_true", help="Log every written label file")
     
     args = parser.parse_args()
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
     dataset_root = Path(args.dataset_path)
     
     process_annotations(dataset_root)
@@ -10,7 +10,7 @@ overlays indicating the number and type of detected objects.
 Functions:
     load_config_file(config_file_path): Load the configuration file and extract the label file path.
     load_label_file(label_file_path): Load labels from the label file and create a mapping of class names to IDs.
-    process_frame(frame_meta, object_classes, batch_meta): Process each frame, count objects, and update display metadata.
+    process_frame(frame_meta, class_names, batch_meta): Process each frame, count objects, and update display metadata.
     create_pipeline(device_path): Create and configure the GStreamer pipeline and its elements.
     link_elements(elements): Link the GStreamer elements within the pipeline.
     osd_sink_pad_buffer_probe(pad, info, u_data): Probe function to handle metadata extraction and display updates.
@@ -21,6 +21,7 @@ Functions:
 import os
 import sys
 import logging
+from collections import Counter
 from datetime import datetime
 
 sys.path.append('../')
@@ -57,15 +58,15 @@ def load_config_file(config_file_path):
         ValueError: If the label file path is not found in the configuration file.
     """
     with open(config_file_path, 'r') as config_file:
-        lines = config_file.readlines()
-    for line in lines:
-        if 'labelfile-path=' in line:
-            return line.split('=')[1].strip()
+        for line in config_file:
+            if line.startswith('labelfile-path='):
+                return line.split('=', 1)[1].strip()
     raise ValueError("Label file path not found in config file")
 
 def load_label_file(label_file_path):
     """
     Load labels from the label file and create a dictionary mapping class names to IDs.
+    Blank lines are skipped, the IDs of the other labels are their line numbers.
 
     Args:
         label_file_path (str): Path to the label file.
@@ -74,22 +75,22 @@ def load_label_file(label_file_path):
         dict: Dictionary mapping class names to their respective IDs.
     """
     with open(label_file_path, 'r') as label_file:
-        lines = label_file.read().splitlines()
-    return {line: i for i, line in enumerate(lines)}
+        return {line.rstrip('\r\n'): i for i, line in enumerate(label_file) if line.strip()}
 
-def process_frame(frame_meta, object_classes, batch_meta):
+def process_frame(frame_meta, class_names, batch_meta):
     """
     Process each frame, count objects, and update display metadata.
 
     Args:
         frame_meta: Frame metadata.
-        object_classes (dict): Dictionary mapping class names to IDs.
+        class_names (dict): Dictionary mapping IDs to class names.
         batch_meta: Batch metadata.
 
     Returns:
         None
     """
-    obj_counter = {id: 0 for _, id in object_classes.items()}
+    # Only classes present in the frame are counted and displayed
+    obj_counter = Counter()
     frame_number = frame_meta.frame_num
     num_rects = frame_meta.num_obj_meta
     l_obj = frame_meta.obj_meta_list
@@ -109,13 +110,10 @@ def process_frame(frame_meta, object_classes, batch_meta):
     display_meta = pyds.nvds_acquire_display_meta_from_pool(batch_meta)
     display_meta.num_labels = 1
     py_nvosd_text_params = display_meta.text_params[0]
-    display_txt = f"Frame Number={frame_number} Number of Objects={num_rects}"
+    display_parts = [f"Frame Number={frame_number} Number of Objects={num_rects}"]
+    display_parts.extend(f"{class_names[k]}_count={v}" for k, v in sorted(obj_counter.items()))
     
-    for k, v in obj_counter.items():
-        _class = [cls for cls in object_classes.keys() if object_classes[cls] == k][0]
-        display_txt += f" {_class}_count={v}"
-    
-    py_nvosd_text_params.display_text = display_txt
+    py_nvosd_text_params.display_text = " ".join(display_parts)
     py_nvosd_text_params.x_offset = 10
     py_nvosd_text_params.y_offset = 12
     py_nvosd_text_params.font_params.font_name = "Serif"
@@ -238,13 +236,12 @@ def osd_sink_pad_buffer_probe(pad, info, u_data):
     Args:
         pad: The pad to which the probe is attached.
         info: Buffer information.
-        u_data: User data (unused).
+        u_data: Dictionary mapping class IDs to names, parsed once at startup.
 
     Returns:
         Gst.PadProbeReturn: Status of the probe operation.
     """
-    label_file_path = load_config_file(PGIE_FILE)
-    object_classes = load_label_file(label_file_path)
+    class_names = u_data
     
     gst_buffer = info.get_buffer()
     if not gst_buffer:
@@ -259,7 +256,7 @@ def osd_sink_pad_buffer_probe(pad, info, u_data):
         except StopIteration:
             break
         
-        process_frame(frame_meta, object_classes, batch_meta)
+        process_frame(frame_meta, class_names, batch_meta)
         
         try:
             l_frame = l_frame.next
@@ -291,8 +288,12 @@ def main(args):
     bus.add_signal_watch()
     bus.connect("message", bus_call, loop)
     
+    # Parse the labels once here instead of on every buffer in the probe
+    object_classes = load_label_file(load_config_file(PGIE_FILE))
+    class_names = {id: name for name, id in object_classes.items()}
+
     osdsinkpad = elements["nvosd"].get_static_pad("sink")
-    osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, osd_sink_pad_buffer_probe, 0)
+    osdsinkpad.add_probe(Gst.PadProbeType.BUFFER, osd_sink_pad_buffer_probe, class_names)
     
     logger.info("Starting pipeline")
     elements["pipeline"].set_state(Gst.State.PLAYING)
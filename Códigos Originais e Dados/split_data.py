@@ -1,36 +1,126 @@
-import json
+import os
+import time
 import shutil
-import random
 import argparse
 import logging
 import logging.config
 
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+import numpy as np
+import orjson
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def copy_images(images, src_dir, dest_dir):
+# Linux ioctl that makes dest share the data blocks of src on CoW filesystems (btrfs, xfs)
+FICLONE = 0x40049409
+
+def link_image(src_path, dest_path):
     """
-    Copy selected images to a specified directory.
+    Try to create dest_path without copying data: a hardlink first, then a reflink.
+    Returns True on success, False if a regular copy is needed.
     """
-    for image in images:
-        try:
-            src_path = Path(src_dir) / image['file_name']
-            dest_path = Path(dest_dir) / src_path.name
+    try:
+        os.link(src_path, dest_path)
+        return True
+    except OSError:
+        pass  # Cross-device link or unsupported filesystem
+
+    if fcntl is None:
+        return False
+    try:
+        with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+            fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        return False
+
+def copy_image(image, src_dir, dest_dir, link=False):
+    """
+    Copy a single image to a specified directory.
+    src_dir and dest_dir must be Path objects.
+    If link is True, the image is hardlinked or reflinked when the filesystem allows it.
+    Images already present at the destination with the same size are skipped, unless
+    a full copy is requested and the destination is a hardlink to the source.
+    Returns "copied", "skipped" or "failed".
+    """
+    try:
+        src_path = src_dir / image['file_name']
+        dest_path = dest_dir / src_path.name
+        if dest_path.exists() and dest_path.stat().st_size == src_path.stat().st_size \
+                and (link or not os.path.samefile(src_path, dest_path)):
+            logger.debug(f"Skipping {src_path}, already copied to {dest_path}")
+            return "skipped"
+        # Never write through an existing file, it may be a hardlink to the source
+        dest_path.unlink(missing_ok=True)
+        if not (link and link_image(src_path, dest_path)):
             shutil.copy(src_path, dest_path)
-            logger.info(f"Successfully copied {src_path} to {dest_path}")
-        except Exception as e:
-            logger.error(f"Failed to copy {src_path} to {dest_path}: {e}")
+        logger.debug(f"Successfully copied {src_path} to {dest_path}")
+        return "copied"
+    except Exception as e:
+        logger.error(f"Failed to copy {src_path} to {dest_path}: {e}")
+        return "failed"
 
-def split_dataset(images_dir, labels_json_path, output_dir, train_ratio=0.75, val_ratio=0.1):
+def copy_images(images, src_dir, dest_dir, link=False):
+    """
+    Copy selected images to a specified directory.
+    Copies are I/O bound, so they are spread over a thread pool.
+    """
+    start = time.perf_counter()
+    src_dir = Path(src_dir)
+    dest_dir = Path(dest_dir)
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = Counter(executor.map(lambda image: copy_image(image, src_dir, dest_dir, link), images))
+    logger.info(f"Copied {results['copied']}/{len(images)} images to {dest_dir}, skipped {results['skipped']} already present, "
+                f"in {time.perf_counter() - start:.2f} s")
+
+def write_coco_subset(file_path, sections):
+    """
+    Write a COCO JSON file one record at a time.
+    sections maps each top-level key to an iterable of records, which may be a generator,
+    so the full subset never has to be built in memory.
+    """
+    with open(file_path, 'wb') as file:
+        file.write(b'{')
+        for i, (key, records) in enumerate(sections.items()):
+            file.write(b',\n' if i else b'\n')
+            file.write(b'  ' + orjson.dumps(key) + b': [')
+            separator = b'\n    '
+            for record in records:
+                file.write(separator + orjson.dumps(record))
+                separator = b',\n    '
+            file.write(b'\n  ]')
+        file.write(b'\n}\n')
+
+def split_dataset(images_dir, labels_json_path, output_dir, train_ratio=0.75, val_ratio=0.1, link=False, seed=None):
     """
     Splits a COCO dataset into training, validation, and testing sets based on given ratios.
+    If link is True, images are hardlinked or reflinked instead of copied when possible.
+    A fixed seed makes the split reproducible.
     """
 
     logger.info("Loading COCO annotations...")
-    with open(labels_json_path, 'r') as f:
-        coco_data = json.load(f)
+    # Every image and annotation is needed until the splits are written, so load the file at once
+    with open(labels_json_path, 'rb') as f:
+        coco_data = orjson.loads(f.read())
+
+    # Extract image and annotation details
+    images = coco_data.get('images', [])
+    categories = coco_data['categories']
+
+    # Group annotations by image id once, so each split only touches its own images
+    annotations_by_image = defaultdict(list)
+    for annotation in coco_data.get('annotations', []):
+        annotations_by_image[annotation['image_id']].append(annotation)
 
     images_dir = Path(images_dir)
     output_dir = Path(output_dir)
@@ -39,16 +129,13 @@ def split_dataset(images_dir, labels_json_path, output_dir, train_ratio=0.75, va
         logger.error(f"Images directory does not exist: {images_dir}")
         return
 
-    # Extract image and annotation details
-    images = coco_data.get('images', [])
-    annotations = coco_data.get('annotations', [])
-
     # Validate ratios
     if not (0 < train_ratio < 1 and 0 <= val_ratio < 1 and train_ratio + val_ratio <= 1):
         logger.error("Invalid training/validation ratios.")
         return
 
-    random.shuffle(images)
+    order = np.random.default_rng(seed).permutation(len(images))
+    images = [images[i] for i in order]
     total_images = len(images)
     train_end = int(total_images * train_ratio)
     val_end = train_end + int(total_images * val_ratio)
@@ -58,15 +145,8 @@ def split_dataset(images_dir, labels_json_path, output_dir, train_ratio=0.75, va
     test_images = images[val_end:]
 
     def filter_annotations(images_set):
-        image_ids = {image['id'] for image in images_set}
-        return [annotation for annotation in annotations if annotation['image_id'] in image_ids]
-
-    def create_coco_subset(images, annotations):
-        return {
-            'images': images,
-            'annotations': annotations,
-            'categories': coco_data['categories']
-        }
+        for image in images_set:
+            yield from annotations_by_image.get(image['id'], ())
 
     for type, images_set in zip(["train", "val", "test"], [train_images, val_images, test_images]):
         try:
@@ -76,11 +156,13 @@ def split_dataset(images_dir, labels_json_path, output_dir, train_ratio=0.75, va
             labels_output_path = output_dir / "labels" / type
             labels_output_path.mkdir(parents=True, exist_ok=True)
 
-            copy_images(images_set, images_dir, images_output_path)
+            copy_images(images_set, images_dir, images_output_path, link)
 
-            coco_file = create_coco_subset(images_set, filter_annotations(images_set))
-            with open(labels_output_path / "coco.json", 'w') as file:
-                json.dump(coco_file, file, indent=4)
+            write_coco_subset(labels_output_path / "coco.json", {
+                'images': images_set,
+                'annotations': filter_annotations(images_set),
+                'categories': categories
+            })
             logger.info(f"Dataset for {type} saved successfully.")
         except Exception as e:
             logger.error(f"Failed to process data for {type}: {e}")
@@ -92,6 +174,12 @@ if __name__ == "__main__":
     parser.add_argument("output_dir", help="Path to the root output directory for training, validation, and testing sets.")
     parser.add_argument("--train_ratio", type=float, default=0.75, help="Proportion of images for training (default: 0.75)")
     parser.add_argument("--val_ratio", type=float, default=0.1, help="Proportion of images for validation (default: 0.1)")
+    parser.add_argument("--link", dest="link", action="store_true", default=False, help="Hardlink or reflink images when possible, the split images then share their data with the source dataset")
+    parser.add_argument("--copy", dest="link", action="store_false", help="Make full copies of the images (default)")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for a reproducible split (default: random)")
+    parser.add_argument("--verbose", action="store_true", help="Log every copied image")
 
     args = parser.parse_args()
-    split_dataset(args.images_dir, args.coco_json_path, args.output_dir, args.train_ratio, args.val_ratio)
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+    split_dataset(args.images_dir, args.coco_json_path, args.output_dir, args.train_ratio, args.val_ratio, args.link, args.seed)